@@ -14,6 +14,7 @@
 # ==============================================================================
 
 
+import os
 from typing import Any, Callable
 from typing_extensions import TypedDict  # Python 3.10+
 
@@ -21,14 +22,14 @@ import torch
 import transformers
 from torch.utils.data import Dataset
 from torchvision import transforms
-from tqdm import tqdm
 from transformers.tokenization_utils import PaddingStrategy, TruncationStrategy
 
-from align_anything.utils.multi_process import get_current_device, is_main_process
-from align_anything.utils.tools import right_padding
 from datasets import load_dataset
 
 
+os.environ.setdefault('TOKENIZERS_PARALLELISM', 'true')
+
+
 __all__ = [
     'PreferenceDataset',
     'PreferenceCollator',
@@ -39,18 +40,26 @@ __all__ = [
 
 class PreferenceSample(TypedDict, total=True):
     input_ids: torch.LongTensor  # size = (L,)
-    labels: torch.LongTensor  # size = (L,)
-    audios: torch.LongTensor | None  # size = (B, C, H, W)
+    audios: torch.HalfTensor  # size = (2 * C, H, W)
 
 
 class PreferenceBatch(TypedDict, total=True):
     input_ids: torch.LongTensor  # size = (B, L)
-    labels: torch.LongTensor  # size = (B, L)
     attention_mask: torch.BoolTensor  # size = (B, L)
-    audios: torch.LongTensor | None  # size = (B, C, H, W)
+    audios: torch.HalfTensor  # size = (B, 2 * C, H, W)
 
 
 class PreferenceDataset(Dataset):
+    """Preference dataset for text-to-audio alignment.
+
+    The collator returns CPU tensors so that the dataset can be wrapped with
+    ``DataLoader(dataset, num_workers=N, persistent_workers=True,
+    prefetch_factor=4, pin_memory=True, collate_fn=dataset.get_collator())``
+    and the host-to-device transfer can overlap with compute; ``pin_memory``
+    must be left to the DataLoader, which pins in the consumer process where
+    it is valid. Moving the batch to the device is left to the training loop
+    (or the Accelerate / DeepSpeed engine preparing the dataloader).
+    """
 
     def __init__(
         self,
@@ -86,35 +95,111 @@ class PreferenceDataset(Dataset):
             size = min(size, len(self.raw_data))
             self.raw_data = self.raw_data.select(range(int(size)))
         self.valid_indices = self.filter_indices()
+        if self.processor is not None:
+            self.raw_data = self.raw_data.map(
+                self._process_audio_batch,
+                batched=True,
+                batch_size=64,
+                num_proc=min(8, os.cpu_count()),
+                load_from_cache_file=True,
+                desc='Preprocessing audio',
+            )
+        self.input_ids_cache = self.pre_tokenize()
+        self.input_ids, self.lengths, self.audios = self._build_soa_tensors()
+
+    def _build_soa_tensors(
+        self,
+    ) -> tuple[torch.LongTensor, torch.LongTensor, torch.HalfTensor | None]:
+        """Materialize all samples as contiguous structure-of-arrays tensors."""
+        lengths = torch.tensor([ids.numel() for ids in self.input_ids_cache], dtype=torch.long)
+        max_length = int(lengths.max()) if len(self.valid_indices) > 0 else 0
+        input_ids = torch.full(
+            (len(self.valid_indices), max_length),
+            self.tokenizer.pad_token_id,
+            dtype=torch.long,
+        )
+        for i, ids in enumerate(self.input_ids_cache):
+            input_ids[i, : ids.numel()] = ids
+
+        audios = None
+        for i, valid_idx in enumerate(self.valid_indices):
+            sample_audios = self.preprocess(self.raw_data[valid_idx])['audios']
+            if audios is None:
+                # float16 halves host memory and H2D bandwidth; mixed-precision
+                # training promotes the batch on the device side when needed.
+                audios = torch.empty(
+                    (len(self.valid_indices), *sample_audios.shape),
+                    dtype=torch.float16,
+                )
+            audios[i] = sample_audios
+        return input_ids, lengths, audios
+
+    def _process_audio_batch(self, batch: dict[str, list[Any]]) -> dict[str, list[Any]]:
+        """Run the audio processor over a batch of raw samples for `datasets.map`."""
+        keys = list(batch.keys())
+        better_audios = []
+        worse_audios = []
+        for values in zip(*batch.values()):
+            raw_sample = dict(zip(keys, values))
+            _, multi_modal_info = self.template.format_diffusion_preference_sample(raw_sample)
+            better_audios.append(self.process_audio(multi_modal_info['better_audio']))
+            worse_audios.append(self.process_audio(multi_modal_info['worse_audio']))
+        return {'better_audio_processed': better_audios, 'worse_audio_processed': worse_audios}
+
+    def pre_tokenize(self) -> list[torch.LongTensor]:
+        """Tokenize all valid prompts in a single batch call to the tokenizer."""
+        prompts = [
+            self.template.format_diffusion_preference_sample(self.raw_data[i])[0]
+            for i in self.valid_indices
+        ]
+        encoded = self.tokenizer(
+            prompts,
+            add_special_tokens=False,
+            padding=PaddingStrategy.DO_NOT_PAD,
+            truncation=TruncationStrategy.LONGEST_FIRST,
+            max_length=self.tokenizer.model_max_length,
+        )
+        return [torch.tensor(ids, dtype=torch.long) for ids in encoded['input_ids']]
 
     def filter_indices(self):
-        valid_indices = []
-        for i, item in tqdm(
-            enumerate(self.raw_data),
-            disable=not is_main_process(),
-            total=len(self.raw_data),
-            desc='Filtering valid indices',
-        ):
-            if not hasattr(self.template, 'check_equal'):
-                valid_indices.append(i)
-                continue
-            if not self.template.check_equal(item):
-                if hasattr(self.template, 'check_validation'):
-                    if not self.template.check_validation(item):
-                        continue
-                valid_indices.append(i)
-        return valid_indices
-
-    def preprocess(self, raw_sample: dict[str, Any]) -> PreferenceSample:
-        prompt, multi_modal_info = self.template.format_diffusion_preference_sample(raw_sample)
+        if not hasattr(self.template, 'check_equal'):
+            return list(range(len(self.raw_data)))
+        has_validation = hasattr(self.template, 'check_validation')
+
+        def keep(item):
+            if self.template.check_equal(item):
+                return False
+            if has_validation and not self.template.check_validation(item):
+                return False
+            return True
+
+        self.raw_data = self.raw_data.filter(
+            keep,
+            num_proc=min(8, os.cpu_count()),
+            load_from_cache_file=True,
+            desc='Filtering valid samples',
+        )
+        return list(range(len(self.raw_data)))
+
+    def preprocess(self, raw_sample: dict[str, Any]) -> dict[str, torch.Tensor]:
         return_dict = {}
 
-        return_dict['input_ids'] = self.tokenize(prompt, add_special_tokens=False)
-        better_audios = self.process_audio(multi_modal_info['better_audio'])
-        worse_audios = self.process_audio(multi_modal_info['worse_audio'])
+        if 'better_audio_processed' in raw_sample:
+            better_audios = torch.as_tensor(raw_sample['better_audio_processed'])
+            worse_audios = torch.as_tensor(raw_sample['worse_audio_processed'])
+        else:
+            _, multi_modal_info = self.template.format_diffusion_preference_sample(raw_sample)
+            better_audios = self.process_audio(multi_modal_info['better_audio'])
+            worse_audios = self.process_audio(multi_modal_info['worse_audio'])
 
         # TODO: check the correctness
-        all_audios = torch.cat([better_audios, worse_audios], dim=0)
+        num_better = better_audios.shape[0]
+        all_audios = torch.empty(
+            (num_better + worse_audios.shape[0], *better_audios.shape[1:]),
+            dtype=better_audios.dtype,
+        )
+        all_audios[:num_better] = better_audios
+        all_audios[num_better:] = worse_audios
         return_dict['audios'] = all_audios
 
         return return_dict
@@ -149,12 +234,12 @@ class PreferenceDataset(Dataset):
             return_tensors='pt',
         )['input_ids'][0]
 
-    def __getitem__(self, index: int) -> dict[str, torch.Tensor]:
-        """Get a tokenized data sample by index."""
-        valid_idx = self.valid_indices[index]
-        raw_sample = self.raw_data[valid_idx]
-        data = self.preprocess(raw_sample)
-        return data
+    def __getitem__(self, index: int) -> PreferenceSample:
+        """Get a data sample as views into the preallocated tensors."""
+        return {
+            'input_ids': self.input_ids[index, : self.lengths[index]],
+            'audios': self.audios[index],
+        }
 
     def __len__(self) -> int:
         """Get the number of samples in the dataset."""
@@ -167,20 +252,28 @@ class PreferenceCollator:
         """Initialize a collator."""
         self.pad_token_id = pad_token_id
 
-    def __call__(self, samples: list[PreferenceSample]) -> PreferenceSample:
+    def __call__(self, samples: list[PreferenceSample]) -> PreferenceBatch:
         return_dict = {}
-        current_device = get_current_device()
-
-        return_dict['input_ids'] = right_padding(
-            [sample['input_ids'] for sample in samples],
-            padding_value=self.pad_token_id,
-        ).to(current_device)
-
-        return_dict['audios'] = (
-            torch.stack([sample['audios'] for sample in samples])
-            .to(current_device)
-            .to(memory_format=torch.contiguous_format)
-            .float()
+
+        ids = [sample['input_ids'] for sample in samples]
+        lengths = torch.tensor([t.numel() for t in ids], dtype=torch.long)
+        max_length = int(lengths.max())
+        input_ids = torch.full(
+            (len(ids), max_length),
+            self.pad_token_id,
+            dtype=torch.long,
+        )
+        for i, t in enumerate(ids):
+            input_ids[i, : t.numel()] = t
+        return_dict['input_ids'] = input_ids
+        return_dict['attention_mask'] = torch.arange(max_length) < lengths.unsqueeze(1)
+
+        audios = torch.empty(
+            (len(samples), *samples[0]['audios'].shape),
+            dtype=samples[0]['audios'].dtype,
         )
+        for i, sample in enumerate(samples):
+            audios[i].copy_(sample['audios'])
+        return_dict['audios'] = audios
 
         return return_dict
@@ -14,20 +14,28 @@
 # ==============================================================================
 
 import argparse
+import itertools
 import os
 import pickle
+from concurrent.futures import ThreadPoolExecutor
 
+import pyarrow.feather as feather
 from tqdm import tqdm
 
 from align_anything.evaluation.eval_logger import EvalLogger
-from align_anything.evaluation.inference.vllm_inference import re, save_detail
+from align_anything.evaluation.inference.vllm_inference import (
+    build_detail_record,
+    re,
+    save_details,
+)
+from align_anything.utils.multi_process import is_main_process
 from align_anything.utils.tools import (
     custom_cfgs_to_dict,
     dict_to_namedtuple,
     read_eval_cfgs,
     update_dict,
 )
-from datasets import load_dataset
+from datasets import load_dataset, load_from_disk
 
 
 def load_pickle(file_path):
@@ -36,53 +44,73 @@ def load_pickle(file_path):
     return data
 
 
+def load_shard(file_path):
+    if file_path.endswith('.arrow'):
+        return feather.read_table(file_path, memory_map=True).to_pylist()
+    return load_pickle(file_path)
+
+
+def load_test_dataset(task_dir, name):
+    cache_dir = os.path.join('.hf_ds_cache', f'{task_dir}_{name}'.replace('/', '_'))
+    if os.path.exists(cache_dir):
+        return load_from_disk(cache_dir)
+    dataset = load_dataset(task_dir, name)
+    dataset.save_to_disk(cache_dir)
+    return dataset
+
+
 def evaluator(test_dataset, output_data, file_path):
     num_match = 0
     num_sum = 0
-    question_id = set()
-    for test_item in tqdm(test_dataset, desc='Evaluating'):
-        for output_item in output_data:
-            if (
-                test_item['question_id'] == output_item['question_id']
-                and output_item['question_id'] not in question_id
-            ):
-                question_id.add(output_item['question_id'])
-                num_sum += 1
-                true_or_false = judger(
-                    chr(test_item['correct_choice_idx'] + 65), output_item['response'][0]
-                )
-                true_or_false_loose = judger_loose(
-                    test_item['choices'][test_item['correct_choice_idx']],
-                    output_item['response'][0],
-                )
-                true_or_false = true_or_false or true_or_false_loose
-                if true_or_false:
-                    num_match += 1
-                save_detail(
-                    test_item['question'],
-                    output_item['prompt_text'],
-                    chr(test_item['correct_choice_idx'] + 65),
-                    output_item['response'][0],
-                    true_or_false,
-                    file_path,
-                )
-
+    details = []
+    output_by_question_id = {}
+    for output_item in output_data:
+        output_by_question_id.setdefault(output_item['question_id'], output_item)
+    for test_item in tqdm(
+        test_dataset, desc='Evaluating', disable=not is_main_process(), mininterval=1.0
+    ):
+        output_item = output_by_question_id.pop(test_item['question_id'], None)
+        if output_item is None:
+            continue
+        num_sum += 1
+        correct_choice_idx = test_item['correct_choice_idx']
+        correct_letter = chr(correct_choice_idx + 65)
+        correct_choice_lower = test_item['choices'][correct_choice_idx].lower()
+        response = output_item['response'][0]
+        response_lower = response.lower()
+        true_or_false = judger(correct_letter, response) or judger_loose(
+            correct_choice_lower, response_lower
+        )
+        if true_or_false:
+            num_match += 1
+        details.append(
+            build_detail_record(
+                test_item['question'],
+                output_item['prompt_text'],
+                correct_letter,
+                response,
+                true_or_false,
+            )
+        )
+
+    save_details(details, file_path)
     return num_match, num_sum
 
 
+_CHOICE_RE = re.compile(r'(?<![a-zA-Z])[A-Z](?![a-zA-Z])')
+
+
 def judger(correct_answer, response):
     if correct_answer not in response:
         return False
-    match = re.search(r'(?<![a-zA-Z])[A-Z](?![a-zA-Z])', response)
+    match = _CHOICE_RE.search(response)
     if match:
         return correct_answer == match.group()
     return False
 
 
-def judger_loose(correct_answer, response):
-    if correct_answer.lower() in response.lower():
-        return True
-    return False
+def judger_loose(correct_answer_lower, response_lower):
+    return correct_answer_lower in response_lower
 
 
 def main():
@@ -119,14 +147,14 @@ def main():
         if os.path.isdir(os.path.join(uuid_path, task))
     ]
     for task, task_dir in task_dirs:
-        task_files = os.listdir(task_dir)
-        InferenceOutputs = []
-        for file in task_files:
-            if file.endswith('.pkl'):
-                file_path = os.path.join(task_dir, file)
-                with open(file_path, 'rb') as f:
-                    InferenceOutputs.extend(pickle.load(f))
-        raw_outputs[task] = InferenceOutputs
+        file_paths = [
+            os.path.join(task_dir, file)
+            for file in os.listdir(task_dir)
+            if file.endswith(('.arrow', '.pkl'))
+        ]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            shards = executor.map(load_shard, file_paths)
+        raw_outputs[task] = list(itertools.chain.from_iterable(shards))
 
     data_cfgs = dict_configs.default.data_cfgs
     eval_configs = dict_configs.default.eval_cfgs
@@ -138,7 +166,7 @@ def main():
     os.makedirs(uuid_path, exist_ok=True)
 
     for task, _ in raw_outputs.items():
-        test_data = load_dataset(data_cfgs.task_dir, task)[data_cfgs.split]
+        test_data = load_test_dataset(data_cfgs.task_dir, task)[data_cfgs.split]
 
         file_path = f'{uuid_path}/{task}.json'
         num_match, num_sum = evaluator(test_data, raw_outputs[task], file_path)
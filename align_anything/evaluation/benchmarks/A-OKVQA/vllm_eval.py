@@ -23,7 +23,12 @@ from tqdm import tqdm
 from align_anything.evaluation.data_type import InferenceInput, InferenceOutput
 from align_anything.evaluation.dataloader.base_dataloader import BaseDataLoader
 from align_anything.evaluation.eval_logger import EvalLogger
-from align_anything.evaluation.inference.vllm_inference import BaseInferencer_vllm, save_detail
+from align_anything.evaluation.inference.vllm_inference import (
+    BaseInferencer_vllm,
+    build_detail_record,
+    save_details,
+)
+from align_anything.utils.multi_process import is_main_process
 from align_anything.utils.template_registry import get_eval_template_class as get_template_class
 from align_anything.utils.tools import (
     custom_cfgs_to_dict,
@@ -33,7 +38,16 @@ from align_anything.utils.tools import (
     save_raw_outputs,
     update_dict,
 )
-from datasets import DatasetDict, load_dataset
+from datasets import DatasetDict, load_dataset, load_from_disk
+
+
+def load_test_dataset(task_dir, name):
+    cache_dir = os.path.join('.hf_ds_cache', f'{task_dir}_{name}'.replace('/', '_'))
+    if os.path.exists(cache_dir):
+        return load_from_disk(cache_dir)
+    dataset = load_dataset(task_dir, name)
+    dataset.save_to_disk(cache_dir)
+    return dataset
 
 
 class AOKVQADataLoader(BaseDataLoader):
@@ -93,8 +107,8 @@ class AOKVQAGeneratorVLLM(BaseInferencer_vllm):
         for task, input in data.items():
             raw_output = self.generation(input)
             for item in raw_output:
-                item.prompt = re.sub(r'<image>', '', item.prompt)
-                item.raw_output.prompt = re.sub(r'<image>', '', item.raw_output.prompt)
+                item.prompt = item.prompt.replace('<image>', '')
+                item.raw_output.prompt = item.raw_output.prompt.replace('<image>', '')
             task2details[task] = raw_output
 
         return task2details
@@ -123,49 +137,55 @@ class AOKVQAGeneratorVLLM(BaseInferencer_vllm):
 def evaluator(test_dataset, output_data, file_path):
     num_match = 0
     num_sum = 0
-    question_id = set()
-    for test_item in tqdm(test_dataset, desc='Evaluating'):
-        for output_item in output_data:
-            if (
-                test_item['question_id'] == output_item.question_id
-                and output_item.question_id not in question_id
-            ):
-                question_id.add(output_item.question_id)
-                num_sum += 1
-                true_or_false = judger(
-                    chr(test_item['correct_choice_idx'] + 65), output_item.response[0]
-                )
-                true_or_false_loose = judger_loose(
-                    test_item['choices'][test_item['correct_choice_idx']], output_item.response[0]
-                )
-                true_or_false = true_or_false or true_or_false_loose
-                if true_or_false:
-                    num_match += 1
-                save_detail(
-                    test_item['question'],
-                    output_item.prompt,
-                    chr(test_item['correct_choice_idx'] + 65),
-                    output_item.response[0],
-                    true_or_false,
-                    file_path,
-                )
+    details = []
+    output_by_question_id = {}
+    for output_item in output_data:
+        output_by_question_id.setdefault(output_item.question_id, output_item)
+    for test_item in tqdm(
+        test_dataset, desc='Evaluating', disable=not is_main_process(), mininterval=1.0
+    ):
+        output_item = output_by_question_id.pop(test_item['question_id'], None)
+        if output_item is None:
+            continue
+        num_sum += 1
+        correct_choice_idx = test_item['correct_choice_idx']
+        correct_letter = chr(correct_choice_idx + 65)
+        correct_choice_lower = test_item['choices'][correct_choice_idx].lower()
+        response = output_item.response[0]
+        response_lower = response.lower()
+        true_or_false = judger(correct_letter, response) or judger_loose(
+            correct_choice_lower, response_lower
+        )
+        if true_or_false:
+            num_match += 1
+        details.append(
+            build_detail_record(
+                test_item['question'],
+                output_item.prompt,
+                correct_letter,
+                response,
+                true_or_false,
+            )
+        )
 
+    save_details(details, file_path)
     return num_match, num_sum
 
 
+_CHOICE_RE = re.compile(r'(?<![a-zA-Z])[A-Z](?![a-zA-Z])')
+
+
 def judger(correct_answer, response):
     if correct_answer not in response:
         return False
-    match = re.search(r'(?<![a-zA-Z])[A-Z](?![a-zA-Z])', response)
+    match = _CHOICE_RE.search(response)
     if match:
         return correct_answer == match.group()
     return False
 
 
-def judger_loose(correct_answer, response):
-    if correct_answer.lower() in response.lower():
-        return True
-    return False
+def judger_loose(correct_answer_lower, response_lower):
+    return correct_answer_lower in response_lower
 
 
 def main():
@@ -217,7 +237,7 @@ def main():
     os.makedirs(uuid_path, exist_ok=True)
 
     for task, _ in raw_outputs.items():
-        test_data = load_dataset(data_cfgs.task_dir, task)[data_cfgs.split]
+        test_data = load_test_dataset(data_cfgs.task_dir, task)[data_cfgs.split]
         file_path = f'{uuid_path}/{task}.json'
         num_match, num_sum = evaluator(test_data, raw_outputs[task], file_path)
 
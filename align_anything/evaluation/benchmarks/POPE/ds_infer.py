@@ -19,6 +19,8 @@ import pickle
 import re
 from typing import Dict, List
 
+import pyarrow as pa
+import pyarrow.feather as feather
 import torch
 import torch.distributed as dist
 from torch.nn.utils.rnn import pad_sequence
@@ -33,6 +35,7 @@ from align_anything.evaluation.inference.ds_inference import (
     get_rank,
 )
 from align_anything.utils.device_utils import get_current_device, set_device
+from align_anything.utils.multi_process import is_main_process
 from align_anything.utils.template_registry import get_eval_template_class as get_template_class
 from align_anything.utils.tools import (
     custom_cfgs_to_dict,
@@ -147,7 +150,7 @@ class POPEGeneratorDS(BaseInferencer_deepspeed):
 
         InferenceOutputs = []
 
-        for batch in tqdm(dataloader):
+        for batch in tqdm(dataloader, disable=not is_main_process(), mininterval=1.0):
             local_rank = int(os.environ['LOCAL_RANK'])
             outputs = self.model.generate(
                 inputs=batch['pad_token_ids'].to(set_device(local_rank)),
@@ -201,12 +204,15 @@ class POPEGeneratorDS(BaseInferencer_deepspeed):
                     'response': item.response,
                 }
             )
-            if dist.is_initialized():
-                file_path = f'{task_dir}/outputs_{get_rank()}.pkl'
-            else:
-                file_path = f'{task_dir}/outputs.pkl'
+        if dist.is_initialized():
+            file_path = f'{task_dir}/outputs_{get_rank()}'
+        else:
+            file_path = f'{task_dir}/outputs'
 
-            with open(file_path, 'wb') as f:
+        try:
+            feather.write_feather(pa.Table.from_pylist(cache_data), f'{file_path}.arrow')
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            with open(f'{file_path}.pkl', 'wb') as f:
                 pickle.dump(cache_data, f, protocol=4)
 
 
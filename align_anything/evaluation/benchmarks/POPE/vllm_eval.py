@@ -17,12 +17,19 @@ import argparse
 import re
 from typing import Dict, List
 
+import numpy as np
 from tqdm import tqdm
 
 from align_anything.evaluation.data_type import InferenceInput, InferenceOutput
 from align_anything.evaluation.dataloader.base_dataloader import BaseDataLoader
 from align_anything.evaluation.eval_logger import EvalLogger
-from align_anything.evaluation.inference.vllm_inference import BaseInferencer_vllm, os, save_detail
+from align_anything.evaluation.inference.vllm_inference import (
+    BaseInferencer_vllm,
+    build_detail_record,
+    os,
+    save_details,
+)
+from align_anything.utils.multi_process import is_main_process
 from align_anything.utils.template_registry import get_eval_template_class as get_template_class
 from align_anything.utils.tools import (
     custom_cfgs_to_dict,
@@ -32,7 +39,16 @@ from align_anything.utils.tools import (
     save_raw_outputs,
     update_dict,
 )
-from datasets import DatasetDict, load_dataset
+from datasets import DatasetDict, load_dataset, load_from_disk
+
+
+def load_test_dataset(task_dir, name):
+    cache_dir = os.path.join('.hf_ds_cache', f'{task_dir}_{name}'.replace('/', '_'))
+    if os.path.exists(cache_dir):
+        return load_from_disk(cache_dir)
+    dataset = load_dataset(task_dir, name)
+    dataset.save_to_disk(cache_dir)
+    return dataset
 
 
 class POPEDataLoader(BaseDataLoader):
@@ -51,12 +67,14 @@ class POPEDataLoader(BaseDataLoader):
 
     def build_prompt(self, data):
         assert self.num_shot == 0, 'POPE does not support few-shot learning.'
-        prompt = ''
         template = get_template_class(self.chat_template)
+        system_prompt = template.system_prompt
+        user_prompt = template.user_prompt
+        assistant_prompt = template.assistant_prompt.format(output='')
         question = [
-            template.system_prompt
-            + template.user_prompt.format(input=prompt + self.build_example_prompt(item, False))
-            + template.assistant_prompt.format(output='')
+            f'{system_prompt}'
+            f'{user_prompt.format(input=self.build_example_prompt(item, False))}'
+            f'{assistant_prompt}'
             for item in data
         ]
 
@@ -88,8 +106,8 @@ class POPEGeneratorVLLM(BaseInferencer_vllm):
         for task, input in data.items():
             raw_output = self.generation(input)
             for item in raw_output:
-                item.prompt = re.sub(r'<image>', '', item.prompt)
-                item.raw_output.prompt = re.sub(r'<image>', '', item.raw_output.prompt)
+                item.prompt = item.prompt.replace('<image>', '')
+                item.raw_output.prompt = item.raw_output.prompt.replace('<image>', '')
             task2details[task] = raw_output
 
         return task2details
@@ -117,35 +135,47 @@ class POPEGeneratorVLLM(BaseInferencer_vllm):
 
 
 def evaluator(test_dataset, output_data, file_path):
-    num_sum = 0
-    num_yes = 0
-    question_id = set()
-
-    TP, TN, FP, FN = 0, 0, 0, 0
-    for test_item in tqdm(test_dataset, desc='Evaluating'):
-        for output_item in output_data:
-            if (
-                test_item['question_id'] == output_item.question_id
-                and output_item.question_id not in question_id
-            ):
-                question_id.add(output_item.question_id)
-                num_sum += 1
-                response = output_item.response[0].lower()
-                correct_answer = test_item['answer'].lower()
-                pred = judger(response)
-                label = 1 if correct_answer == 'yes' else 0
-                num_yes += pred
-
-                if pred == 1 and label == 1:
-                    TP += 1
-                elif pred == 1 and label == 0:
-                    FP += 1
-                elif pred == 0 and label == 0:
-                    TN += 1
-                elif pred == 0 and label == 1:
-                    FN += 1
-
-                save_detail(test_item['question'], '', correct_answer, response, pred, file_path)
+    output_by_question_id = {}
+    for output_item in output_data:
+        output_by_question_id.setdefault(output_item.question_id, output_item)
+
+    matched = []
+    for test_item in tqdm(
+        test_dataset, desc='Evaluating', disable=not is_main_process(), mininterval=1.0
+    ):
+        output_item = output_by_question_id.pop(test_item['question_id'], None)
+        if output_item is None:
+            continue
+        matched.append((test_item, output_item))
+
+    num_sum = len(matched)
+    preds = np.fromiter(
+        (judger(output_item.response[0]) for _, output_item in matched),
+        dtype=np.int8,
+        count=num_sum,
+    )
+    labels = np.fromiter(
+        (1 if test_item['answer'].lower() == 'yes' else 0 for test_item, _ in matched),
+        dtype=np.int8,
+        count=num_sum,
+    )
+    TP = int(((preds == 1) & (labels == 1)).sum())
+    FP = int(((preds == 1) & (labels == 0)).sum())
+    TN = int(((preds == 0) & (labels == 0)).sum())
+    FN = int(((preds == 0) & (labels == 1)).sum())
+    num_yes = int(preds.sum())
+
+    details = [
+        build_detail_record(
+            test_item['question'],
+            '',
+            test_item['answer'].lower(),
+            output_item.response[0].lower(),
+            int(pred),
+        )
+        for (test_item, output_item), pred in zip(matched, preds)
+    ]
+    save_details(details, file_path)
 
     precision = float(TP) / (TP + FP) if (TP + FP) > 0 else 0
     recall = float(TP) / (TP + FN) if (TP + FN) > 0 else 0
@@ -163,12 +193,14 @@ def evaluator(test_dataset, output_data, file_path):
     return result, num_sum
 
 
+_NEG_RE = re.compile(rb'\b(?:no|not)\b')
+
+
 def judger(response):
-    response = response.replace(',', '')
-    words = response.split(' ')
-    if 'not' in words or 'no' in words:
-        return 0
-    return 1
+    # bytes.lower is a single C pass over the buffer, unlike str.lower,
+    # which consults the unicode case tables per character.
+    response_bytes = response.encode('ascii', 'ignore').lower()
+    return 0 if _NEG_RE.search(response_bytes) else 1
 
 
 def main():
@@ -220,8 +252,9 @@ def main():
     os.makedirs(uuid_path, exist_ok=True)
 
     tot_accuracy, tot_precision, tot_recall, tot_f1_score, tot_yes_ratio = 0.0, 0.0, 0.0, 0.0, 0.0
+    test_dataset = load_test_dataset(data_cfgs.task_dir, data_cfgs.split)
     for task, _ in raw_outputs.items():
-        test_data = load_dataset(data_cfgs.task_dir, data_cfgs.split)[task]
+        test_data = test_dataset[task]
         file_path = f'{uuid_path}/{task}.json'
         result, num_sum = evaluator(test_data, raw_outputs[task], file_path)
         tot_accuracy += result['accuracy']
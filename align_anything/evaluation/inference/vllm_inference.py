@@ -66,7 +66,7 @@ def extract_choices(prompt):
     return choices
 
 
-def save_detail(question, prompt, correct_answer, response, score, file_path, gpt_response=None):
+def build_detail_record(question, prompt, correct_answer, response, score, gpt_response=None):
     choices = extract_choices(prompt)
     if choices:
         record = {
@@ -85,6 +85,16 @@ def save_detail(question, prompt, correct_answer, response, score, file_path, gp
         }
     if gpt_response:
         record['gpt_response'] = gpt_response
+    return record
+
+
+def save_details(records, file_path):
+    with open(file_path, 'w', encoding='utf-8') as file:
+        json.dump(records, file, ensure_ascii=False, indent=4)
+
+
+def save_detail(question, prompt, correct_answer, response, score, file_path, gpt_response=None):
+    record = build_detail_record(question, prompt, correct_answer, response, score, gpt_response)
     if not os.path.exists(file_path):
         with open(file_path, 'w', encoding='utf-8') as file:
             json.dump([record], file, ensure_ascii=False, indent=4)